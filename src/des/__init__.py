@@ -1,3 +1,3 @@
-from .algorithm import DES
+from .algorithm import DES, estimate
 
-__all__ = ["DES"]
+__all__ = ["DES", "estimate"]
@@ -3,6 +3,8 @@ REFERENCE PAPER:
   "Distinct Elements in Streams: An Algorithm for the (Text) Book" ( https://arxiv.org/pdf/2301.10191 )
 """
 
+import functools
+import itertools
 import math
 import random
 import threading
@@ -16,12 +18,13 @@ _fail_prob_default: float = 0.05
 _threshold_type = int | Callable[[int, Optional[float], Optional[float]], int]
 
 
+@functools.lru_cache(maxsize=128)
 def calculate_threshold(
     stream_size: int, relative_error_tolerance: float, failure_probability: float
 ) -> int:
     """
     Calculate the threshold for the DES algorithm based on the stream size, relative error tolerance,
-    and failure probability.
+    and failure probability. Results are memoized, invalid arguments still raise as exceptions are not cached.
 
     Args:
         stream_size (int): the number of items in the stream.
@@ -54,17 +57,173 @@ def calculate_threshold(
     )
 
 
+def _threshold_function(
+    threshold: _threshold_type,
+) -> Callable[[int, float, float], int]:
+    """
+    Normalize a threshold into a function of the stream size, relative error tolerance and failure probability, so
+    the threshold type is only checked once.
+
+    Args:
+        threshold (_threshold_type): the threshold or a function to calculate it from the stream size.
+
+    Returns:
+        Callable[[int, float, float], int]: the function which calculates the threshold.
+    """
+    if callable(threshold):
+        return threshold
+
+    return (
+        lambda _stream_size, _relative_error_tolerance, _failure_probability: threshold
+    )
+
+
+def _down_sample(acc_set: set, rand_getrandbits: Callable[[int], int], thresh: int):
+    """
+    Down sample the accumulated set in place by removing each element with p 1/2.
+
+    Args:
+        acc_set (set): the accumulated set of distinct elements to down sample.
+        rand_getrandbits (Callable[[int], int]): the getrandbits method of the random number generator to draw from.
+        thresh (int): the threshold the set must be down sampled below.
+
+    Raises:
+        OverflowError: if the set could not be down sampled below the threshold.
+    """
+    # draw every coin flip in a single call and apply the bits as a mask where a clear bit drops the element. the
+    # drops are removed in place so the survivors are not rehashed into a new set
+    set_size = len(acc_set)
+    mask = map("0".__eq__, f"{rand_getrandbits(set_size):0{set_size}b}")
+    acc_set.difference_update(list(itertools.compress(acc_set, mask)))
+
+    set_size = len(acc_set)
+    if set_size >= thresh:
+        raise OverflowError(
+            f"Could not down sample the set to the desired threshold: {thresh}, set_size: {set_size}"
+        )
+
+
+def _process_stream(
+    stream: Iterator | Iterable,
+    thresh: int,
+    acc_set: set,
+    prob_shift: int,
+    hit_count: int,
+    rand: random.Random,
+    poll_rate: int = 0,
+    on_poll: Callable[[int, int], object] | None = None,
+) -> tuple[int, int]:
+    """
+    Run the DES algorithm over a stream, continuing from the given state. All the state is held in locals so
+    independent calls can run concurrently without any locking. acc_set is updated in place, including when it is
+    down sampled, so its hash table is reused for the whole stream.
+
+    Args:
+        stream (Iterator | Iterable): the stream of items to process.
+        thresh (int): the threshold at which the accumulated set is down sampled.
+        acc_set (set): the accumulated set of distinct elements to continue from, updated in place.
+        prob_shift (int): the current sampling probability as a power of two, i.e. p = 2 ** -prob_shift.
+        hit_count (int): the number of times the threshold has been hit so far.
+        rand (random.Random): the random number generator to draw from.
+        poll_rate (int): the number of items processed between each call to on_poll (0 disables polling).
+        on_poll (Callable[[int, int], object] | None): called with the current prob_shift and hit_count every
+            poll_rate items, and once more when the stream ends or raises.
+
+    Returns:
+        tuple[int, int]: the final prob_shift and hit_count.
+
+    Raises:
+        OverflowError: if the set could not be down sampled below the threshold.
+    """
+    assert thresh > 0, "Threshold must be greater than 0"
+
+    acc_add = acc_set.add
+    acc_discard = acc_set.discard
+    rand_getrandbits = rand.getrandbits
+
+    try:
+        # a previous call with a larger threshold can leave the set at or above this threshold, so restore the invariant
+        # up front and the loop only has to check it after an insertion
+        if len(acc_set) >= thresh:
+            hit_count += 1
+            prob_shift += 1
+            _down_sample(acc_set, rand_getrandbits, thresh)
+
+        poll_remaining = poll_rate
+        for item in stream:
+            acc_discard(item)
+
+            # keep the item with p 2 ** -prob_shift, i.e. when all of prob_shift random bits are zero
+            if not rand_getrandbits(prob_shift):
+                acc_add(item)
+
+                # the set only grows on an insertion, so the threshold can only be reached here
+                if len(acc_set) >= thresh:
+                    hit_count += 1
+                    prob_shift += 1
+                    _down_sample(acc_set, rand_getrandbits, thresh)
+
+            poll_remaining -= 1
+            if not poll_remaining:
+                poll_remaining = poll_rate
+                if on_poll is not None:
+                    on_poll(prob_shift, hit_count)
+    finally:
+        # publish the final state even when the stream or a down sample raises, as acc_set has already been updated
+        # in place and the caller's state must stay consistent with it
+        if on_poll is not None:
+            on_poll(prob_shift, hit_count)
+
+    return prob_shift, hit_count
+
+
+def estimate(
+    stream: Iterator | Iterable,
+    stream_size: int,
+    threshold: _threshold_type = calculate_threshold,
+    relative_error_tolerance: float = _rel_err_tol_default,
+    failure_probability: float = _fail_prob_default,
+    seed: int | None = None,
+) -> tuple[int, int]:
+    """
+    Estimate the distinct elements in a stream using the DES algorithm without any shared state, so multiple
+    streams can be estimated concurrently.
+
+    Args:
+        stream (Iterator | Iterable): the stream of items to process.
+        stream_size (int): the number of items in the stream.
+        threshold (_threshold_type): the threshold or a function to calculate it from the stream size.
+        relative_error_tolerance (float): the relative error tolerance passed to the threshold function.
+        failure_probability (float): the failure probability passed to the threshold function.
+        seed (int | None): the seed for the random number generator.
+
+    Returns:
+        tuple[int, int]: the estimated number of distinct elements in the stream and the threshold hit count.
+    """
+    thresh = _threshold_function(threshold)(
+        stream_size, relative_error_tolerance, failure_probability
+    )
+    rand = random.Random(seed if seed is not None else random.randint(0, (2**32 - 1)))
+
+    acc_set = set()
+    prob_shift, hit_count = _process_stream(stream, thresh, acc_set, 0, 0, rand)
+
+    return len(acc_set) << prob_shift, hit_count
+
+
 class DES:
     _threshold: _threshold_type
     _threshold_hit_count: int
+    _get_threshold: Callable[[int], int]
     relative_error_tolerance: float
     failure_probability: float
     seed: int
     acc_set: set  # this set accumulates the distinct elements and maintains that it's size is less than the threshold
-    cur_probability: float
+    _prob_shift: int  # the current sampling probability is 2 ** -_prob_shift as it is only ever halved
     rand: random.Random
     distinct_item_count: int
     rlock: threading.RLock
+    _reset_count: int  # incremented on every reset, so a stream can tell its state was replaced while it ran
 
     def __init__(
         self,
@@ -74,38 +233,68 @@ class DES:
         seed: int | None = None,
     ):
         self._threshold = threshold
+
+        # specialize the threshold lookup once so it does not re-check the threshold type on every call
+        threshold_function = _threshold_function(threshold)
+        self._get_threshold = lambda stream_size: threshold_function(
+            stream_size, self.relative_error_tolerance, self.failure_probability
+        )
+
         self.relative_error_tolerance = relative_error_tolerance
         self.failure_probability = failure_probability
         self.seed = seed if seed is not None else random.randint(0, (2**32 - 1))
         self.rlock = threading.RLock()
+        self._reset_count = 0
 
         self.reset()
 
     def reset(self):
         with self.rlock:
-            self.distinct_item_count = 0
-            self._threshold_hit_count = 0
-            self.rand = random.Random(self.seed)
+            self._reset()
+
+    def _reset(self):
+        # must be called with the lock held
+        self._reset_count += 1
+        self.distinct_item_count = 0
+        self._threshold_hit_count = 0
+        self.rand = random.Random(self.seed)
 
-            # initialize probability and distinct word set
-            self.acc_set = set()
-            self.cur_probability = 1.0
+        # initialize probability and distinct word set
+        self.acc_set = set()
+        self._prob_shift = 0
+
+    @property
+    def cur_probability(self) -> float:
+        return math.ldexp(1.0, -self._prob_shift)
 
     def get_threshold(self, stream_size: int) -> int:
-        return (
-            (
-                self._threshold(
-                    stream_size, self.relative_error_tolerance, self.failure_probability
-                )
-            )
-            if callable(self._threshold)
-            else self._threshold
-        )
+        return self._get_threshold(stream_size)
 
     def get_threshold_hit_count(self) -> int:
+        """
+        Get the number of times the threshold has been hit.
+
+        This takes the lock, which a running distinct call holds for its whole stream. From another thread it blocks
+        until the stream finishes, from the stream itself on the same thread it returns the count published at the
+        last poll.
+
+        Returns:
+            int: the number of times the threshold has been hit.
+        """
         with self.rlock:
             return self._threshold_hit_count
 
+    def _publish(self, reset_count: int, prob_shift: int, hit_count: int):
+        with self.rlock:
+            # the lock is re-entrant, so the stream can reset() the instance on the same thread. that replaces the
+            # state the loop is working on, which must then not be written back over the reset state
+            if reset_count != self._reset_count:
+                return
+
+            self._prob_shift = prob_shift
+            self._threshold_hit_count = hit_count
+            self.distinct_item_count = len(self.acc_set) << prob_shift
+
     def distinct(
         self,
         stream: Iterator | Iterable,
@@ -116,68 +305,39 @@ class DES:
         """
         Calculate the distinct elements in a stream using the DES algorithm.
 
+        The lock is held for the whole stream, so calls from other threads that take it (e.g. reset() and
+        get_threshold_hit_count()) wait for the stream to finish. The state published every poll_rate items is visible
+        to the stream itself on the same thread, and to other threads through the distinct_item_count attribute which
+        is read without the lock.
+
         Args:
             stream (Iterator | Iterable): the stream of items to process.
             stream_size (int): the number of items in the stream.
             reset_state (bool): whether to reset the state of the algorithm before processing the stream.
             poll_rate (int): the rate at which to update the distinct element count (based on the number of items processed).
+                A poll_rate of 0 or less disables the updates, so the state is only published when the stream ends.
 
         Returns:
             int: the estimated number of distinct elements in the stream.
         """
-        if reset_state is True:
-            self.reset()
-
-        # calculate threshold
-        thresh = (
-            self._threshold(
-                stream_size, self.relative_error_tolerance, self.failure_probability
-            )
-            if callable(self._threshold)
-            else self._threshold
-        )
-
-        assert thresh > 0, "Threshold must be greater than 0"
-
-        if isinstance(stream, Iterable):
-            stream = iter(stream)
-
-        i = 0
-        while (item := next(stream, None)) is not None:
-            with self.rlock:
-                if item in self.acc_set:
-                    self.acc_set.remove(item)
-
-                if self.rand.random() < self.cur_probability:
-                    self.acc_set.add(item)
-
-                if len(self.acc_set) >= thresh:
-                    self._threshold_hit_count += 1
-
-                    # down sample set by removing elements with p 1/2
-                    self.acc_set = {
-                        v for v in self.acc_set if self.rand.random() >= 0.5
-                    }
-                    self.cur_probability = self.cur_probability / 2.0
-
-                    set_size = len(self.acc_set)
-                    if set_size >= thresh:
-                        raise OverflowError(
-                            f"Could not down sample the set to the desired threshold: {thresh}, set_size: {set_size}"
-                        )
-
-            if i % poll_rate == 0:
-                with self.rlock:
-                    self.distinct_item_count = int(
-                        math.floor(len(self.acc_set) / self.cur_probability)
-                    )
-                    i = 0
-
-            i += 1
-
+        # the lock is held for the whole stream, including the state snapshot, so a concurrent reset() waits for the
+        # stream to finish instead of orphaning the state the loop is working on
         with self.rlock:
-            self.distinct_item_count = int(
-                math.floor(len(self.acc_set) / self.cur_probability)
+            if reset_state is True:
+                self._reset()
+
+            thresh = self._get_threshold(stream_size)
+
+            acc_set = self.acc_set
+            prob_shift, _ = _process_stream(
+                stream,
+                thresh,
+                acc_set,
+                self._prob_shift,
+                self._threshold_hit_count,
+                self.rand,
+                poll_rate,
+                functools.partial(self._publish, self._reset_count),
             )
 
-        return self.distinct_item_count
+            return len(acc_set) << prob_shift
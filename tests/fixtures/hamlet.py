@@ -1,4 +1,7 @@
+import contextlib
 import os.path
+import pickle
+import tempfile
 from typing import List
 
 import nltk
@@ -8,7 +11,10 @@ import pytest
 @pytest.fixture(scope="session")
 def hamlet(request) -> List[str]:
     """
-    Load the content of the hamlet file and tokenize the content into an array of words.
+    Load the content of the hamlet file and tokenize the content into an array of words. The tokens are cached to disk
+    next to the hamlet file, keyed on the nltk version, and only re-tokenized when the hamlet file is newer than the
+    cache. The cache is best effort, an unreadable or corrupt cache is re-tokenized and a read-only fixture data
+    directory just skips writing it.
 
     Args:
         request: the pytest request object.
@@ -24,9 +30,30 @@ def hamlet(request) -> List[str]:
     fp = os.path.join(fixture_data_dir_fp, "hamlet.txt")
     assert os.path.exists(fp), f"hamlet file not found: {fp}"
 
+    cache_fp = f"{fp}.nltk-{nltk.__version__}.tokens.pkl"
+    # a missing, unreadable or corrupt cache falls through to re-tokenizing the hamlet file
+    with contextlib.suppress(OSError, EOFError, pickle.UnpicklingError):
+        if os.path.getmtime(cache_fp) >= os.path.getmtime(fp):
+            with open(cache_fp, "rb") as f:
+                return pickle.load(f)
+
     tokenizer = nltk.tokenize.TreebankWordTokenizer()
     with open(fp, "r") as f:
         content = f.read()
         words = tokenizer.tokenize(content)
 
+    # write to a temporary file and move it into place so concurrent sessions never load a partially written cache
+    try:
+        tmp_fd, tmp_fp = tempfile.mkstemp(dir=fixture_data_dir_fp, suffix=".tmp")
+    except OSError:
+        return words
+
+    try:
+        with os.fdopen(tmp_fd, "wb") as f:
+            pickle.dump(words, f)
+        os.replace(tmp_fp, cache_fp)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_fp)
+
     return words
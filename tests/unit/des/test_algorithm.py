@@ -1,9 +1,11 @@
+import threading
 import timeit
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 import pytest
 
-from des.algorithm import DES
+from des.algorithm import DES, estimate
 
 
 @pytest.mark.unit
@@ -42,3 +44,200 @@ def test_distinct_element_count_algorithm(hamlet: List[str]):
     assert (
         avg_accuracy >= 0.9
     ), f"expected accuracy of at least 0.9, got: {avg_accuracy}"
+
+
+@pytest.mark.unit
+def test_distinct_counts_none_items():
+    stream = [None, "to", None, "be", "to"]
+
+    des = DES(threshold=100, seed=42)
+    count = des.distinct(stream, len(stream))
+
+    # the threshold is never reached so the count is exact
+    exp_count = 3
+    assert count == exp_count, f"expected distinct count of {exp_count}, got: {count}"
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("poll_rate", [10, 0])
+def test_distinct_publishes_count_every_poll_rate_items(poll_rate: int):
+    stream_size = 50
+
+    des = DES(threshold=100, seed=42)
+    observed_counts = []
+
+    def stream():
+        for item in range(stream_size):
+            observed_counts.append(des.distinct_item_count)
+            yield item
+
+    count = des.distinct(stream(), stream_size, poll_rate=poll_rate)
+
+    # the threshold is never reached so every item is kept and the published count is the number of items processed
+    # at the last poll, a poll_rate of 0 disables polling so nothing is published until the stream ends
+    exp_observed_counts = [
+        (processed // poll_rate) * poll_rate if poll_rate > 0 else 0
+        for processed in range(stream_size)
+    ]
+    assert (
+        observed_counts == exp_observed_counts
+    ), f"expected published counts of {exp_observed_counts}, got: {observed_counts}"
+    assert count == stream_size, f"expected count of {stream_size}, got: {count}"
+    assert (
+        des.distinct_item_count == stream_size
+    ), f"expected distinct item count of {stream_size}, got: {des.distinct_item_count}"
+
+
+@pytest.mark.unit
+def test_distinct_down_samples_carried_over_set():
+    des = DES(threshold=lambda stream_size, _rel, _fp: stream_size, seed=1)
+    des.distinct(range(100), 1000)
+    assert (
+        des.get_threshold_hit_count() == 0
+    ), f"expected threshold hit count of 0, got: {des.get_threshold_hit_count()}"
+
+    # the set carried over from the previous call is above this call's threshold, so it must be down sampled even
+    # when no item of this stream is inserted
+    exp_thresh = 80
+    des.distinct([], exp_thresh)
+    assert (
+        len(des.acc_set) < exp_thresh
+    ), f"expected set size below {exp_thresh}, got: {len(des.acc_set)}"
+    assert (
+        des.get_threshold_hit_count() == 1
+    ), f"expected threshold hit count of 1, got: {des.get_threshold_hit_count()}"
+
+
+@pytest.mark.unit
+def test_distinct_down_samples_in_place(hamlet: List[str]):
+    des = DES(threshold=100, seed=42)
+    acc_set = des.acc_set
+    des.distinct(hamlet, len(hamlet))
+
+    assert des.get_threshold_hit_count() > 0, "expected the threshold to be hit"
+    assert (
+        des.acc_set is acc_set
+    ), "expected the accumulated set to be reused across down samples"
+
+
+@pytest.mark.unit
+def test_distinct_reset_during_stream():
+    stream_size = 20000
+    exp_count = DES(threshold=50, seed=1).distinct(range(stream_size), stream_size)
+
+    des = DES(threshold=50, seed=1)
+    resetter = threading.Thread(target=des.reset)
+
+    def stream():
+        for item in range(stream_size):
+            # a reset from another thread mid-stream must wait for the stream to finish
+            if item == stream_size // 2:
+                resetter.start()
+
+            yield item
+
+    count = des.distinct(stream(), stream_size)
+    resetter.join()
+
+    assert count == exp_count, f"expected count of {exp_count}, got: {count}"
+    assert (
+        des.acc_set == set()
+    ), f"expected an empty set after reset, got: {des.acc_set}"
+    assert (
+        des.cur_probability == 1.0
+    ), f"expected probability of 1.0 after reset, got: {des.cur_probability}"
+    assert (
+        des.get_threshold_hit_count() == 0
+    ), f"expected threshold hit count of 0 after reset, got: {des.get_threshold_hit_count()}"
+    assert (
+        des.distinct_item_count == 0
+    ), f"expected distinct item count of 0 after reset, got: {des.distinct_item_count}"
+
+
+@pytest.mark.unit
+def test_distinct_reentrant_calls_from_stream():
+    stream_size = 20000
+    exp_count = DES(threshold=50, seed=1).distinct(range(stream_size), stream_size)
+
+    des = DES(threshold=50, seed=1)
+    thresh_hit_counts = []
+
+    def stream():
+        for item in range(stream_size):
+            # the stream runs while distinct holds the lock, so calling back into the instance on the same thread
+            # must not deadlock
+            thresh_hit_counts.append(des.get_threshold_hit_count())
+            if item == stream_size // 2:
+                des.reset()
+
+            yield item
+
+    with des.rlock:
+        count = des.distinct(stream(), stream_size)
+
+    assert count == exp_count, f"expected count of {exp_count}, got: {count}"
+    assert (
+        thresh_hit_counts[stream_size // 2] > 0
+    ), "expected the threshold hit count to be published mid-stream"
+    assert (
+        des.acc_set == set()
+    ), f"expected an empty set after reset, got: {des.acc_set}"
+    assert (
+        des.get_threshold_hit_count() == 0
+    ), f"expected threshold hit count of 0 after reset, got: {des.get_threshold_hit_count()}"
+    assert (
+        des.distinct_item_count == 0
+    ), f"expected distinct item count of 0 after reset, got: {des.distinct_item_count}"
+
+
+@pytest.mark.unit
+def test_distinct_keeps_state_consistent_when_stream_raises():
+    stream_size = 1000
+    exp_des = DES(threshold=50, seed=1)
+    exp_count = exp_des.distinct(range(stream_size), stream_size, poll_rate=0)
+    exp_thresh_hit_count = exp_des.get_threshold_hit_count()
+    assert exp_thresh_hit_count > 0, "expected the threshold to be hit"
+
+    def stream():
+        yield from range(stream_size)
+        raise RuntimeError("stream failed")
+
+    des = DES(threshold=50, seed=1)
+    with pytest.raises(RuntimeError):
+        des.distinct(stream(), stream_size, poll_rate=0)
+
+    # the state processed before the stream raised must be published, consistent with the set updated in place
+    assert (
+        des.acc_set == exp_des.acc_set
+    ), "expected the same set as a stream that did not raise"
+    assert (
+        des.cur_probability == exp_des.cur_probability
+    ), f"expected probability of {exp_des.cur_probability}, got: {des.cur_probability}"
+    assert (
+        des.get_threshold_hit_count() == exp_thresh_hit_count
+    ), f"expected threshold hit count of {exp_thresh_hit_count}, got: {des.get_threshold_hit_count()}"
+    assert (
+        des.distinct_item_count == exp_count
+    ), f"expected distinct item count of {exp_count}, got: {des.distinct_item_count}"
+
+
+@pytest.mark.unit
+def test_estimate_matches_distinct(hamlet: List[str]):
+    des = DES(threshold=100, seed=42)
+    exp_count = des.distinct(hamlet, len(hamlet))
+    exp_thresh_hit_count = des.get_threshold_hit_count()
+
+    # independent estimates share no state, so running them concurrently must not change the result
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(
+                lambda _: estimate(hamlet, len(hamlet), threshold=100, seed=42),
+                range(4),
+            )
+        )
+
+    for count, thresh_hit_count in results:
+        assert count == exp_count, f"expected count of {exp_count}, got: {count}"
+        assert (
+            thresh_hit_count == exp_thresh_hit_count
+        ), f"expected threshold hit count of {exp_thresh_hit_count}, got: {thresh_hit_count}"